@@ -1,35 +1,116 @@
 import os
+import stat
 
-from flask import Flask, render_template, request, flash, redirect, session, g
-from flask_debugtoolbar import DebugToolbarExtension
+from flask import (
+    Blueprint, Flask, render_template, request, flash, redirect, session, g,
+)
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, load_only
 
-from forms import UserAddForm, LoginForm, MessageForm
-from models import db, connect_db, User, Message
+from compression import CompressionMiddleware, trim_template_whitespace
+from config import configs
+from forms import UserAddForm, UserEditForm, LoginForm, MessageForm
+from models import db, connect_db, model_changed, User, Message
+from ratelimit import RateLimiter
+from tasks import task_queue
 
 CURR_USER_KEY = "curr_user"
 
-app = Flask(__name__)
+# Caching headers for every response; see add_header. Precompressed static
+# files are served outside Flask, so CompressionMiddleware adds them too.
+CACHE_HEADERS = [
+    ("Cache-Control", "public, max-age=0"),
+    ("Pragma", "no-cache"),
+    ("Expires", "0"),
+]
 
-# Get DB_URI from environ variable (useful for production/testing) or,
-# if not set there, use development local db.
-app.config['SQLALCHEMY_DATABASE_URI'] = (
-    os.environ.get('DATABASE_URL', 'postgresql:///warbler'))
+bp = Blueprint('warbler', __name__)
 
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = False
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = True
-app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', "it's a secret")
-toolbar = DebugToolbarExtension(app)
+# Per-user limits key on the session's user id, so checking them doesn't
+# need to load the user.
+limiter = RateLimiter(lambda: session.get(CURR_USER_KEY))
 
-connect_db(app)
+
+def template_bytecode_cache(app):
+    """Return Jinja bytecode cache for `app`.
+
+    Cached bytecode is loaded with marshal, so whoever can write to the
+    cache directory can run code in the app: we refuse a directory that we
+    don't own or that others can write to. With no directory configured,
+    Jinja picks (and checks) a private per-user one in the temp dir.
+    """
+
+    from jinja2 import FileSystemBytecodeCache
+
+    # Trimmed templates compile differently from the same source, so they
+    # mustn't share cache entries with untrimmed ones.
+    pattern = ('__warbler_trim_%s.cache'
+               if app.config['TEMPLATES_TRIM_WHITESPACE']
+               else '__warbler_%s.cache')
+
+    cache_dir = app.config['TEMPLATE_BYTECODE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        info = os.lstat(cache_dir)
+        if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+                or info.st_mode & 0o077):
+            raise RuntimeError(
+                f"Template cache dir {cache_dir!r} must be a directory "
+                f"owned by this user and not accessible to others")
+
+    return FileSystemBytecodeCache(cache_dir, pattern)
+
+
+def create_app(config=None):
+    """Create and configure a Warbler app.
+
+    `config` is a config object (see config.py) or the name of one; if not
+    given, it's picked by the FLASK_ENV environment variable.
+    """
+
+    if config is None:
+        config = os.environ.get('FLASK_ENV', 'production')
+    if isinstance(config, str):
+        config = configs[config]
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    if app.config['TEMPLATE_BYTECODE_CACHE']:
+        # This has to be set up before anything touches app.jinja_env.
+        app.jinja_options = dict(
+            app.jinja_options, bytecode_cache=template_bytecode_cache(app))
+
+    if app.config['TEMPLATES_TRIM_WHITESPACE']:
+        trim_template_whitespace(app)
+
+    if app.config['DEBUG_TB_ENABLED']:
+        # Imported here so that production/test workers never pay for it.
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    connect_db(app)
+    limiter.init_app(app)
+    task_queue.init_app(app)
+    app.register_blueprint(bp)
+
+    app.wsgi_app = CompressionMiddleware(
+        app.wsgi_app,
+        static_folder=app.static_folder,
+        static_url_path=app.static_url_path,
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        level=app.config['COMPRESS_LEVEL'],
+        static_headers=CACHE_HEADERS,
+    )
+
+    return app
 
 
 ##############################################################################
 # User signup/login/logout
 
 
-@app.before_request
+@bp.before_app_request
 def add_user_to_g():
     """If we're logged in, add curr user to Flask global."""
 
@@ -53,7 +134,7 @@ def do_logout():
         del session[CURR_USER_KEY]
 
 
-@app.route('/signup', methods=["GET", "POST"])
+@bp.route('/signup', methods=["GET", "POST"])
 def signup():
     """Handle user signup.
 
@@ -89,7 +170,7 @@ def signup():
         return render_template('users/signup.html', form=form)
 
 
-@app.route('/login', methods=["GET", "POST"])
+@bp.route('/login', methods=["GET", "POST"])
 def login():
     """Handle user login."""
 
@@ -109,17 +190,20 @@ def login():
     return render_template('users/login.html', form=form)
 
 
-@app.route('/logout')
+@bp.route('/logout')
 def logout():
     """Handle logout of user."""
 
-    # IMPLEMENT THIS
+    do_logout()
+    flash("You have successfully logged out.", "success")
+
+    return redirect("/login")
 
 
 ##############################################################################
 # General user routes:
 
-@app.route('/users')
+@bp.route('/users')
 def list_users():
     """Page with listing of users.
 
@@ -136,7 +220,7 @@ def list_users():
     return render_template('users/index.html', users=users)
 
 
-@app.route('/users/<int:user_id>')
+@bp.route('/users/<int:user_id>')
 def users_show(user_id):
     """Show user profile."""
 
@@ -153,7 +237,7 @@ def users_show(user_id):
     return render_template('users/show.html', user=user, messages=messages)
 
 
-@app.route('/users/<int:user_id>/following')
+@bp.route('/users/<int:user_id>/following')
 def show_following(user_id):
     """Show list of people this user is following."""
 
@@ -165,7 +249,7 @@ def show_following(user_id):
     return render_template('users/following.html', user=user)
 
 
-@app.route('/users/<int:user_id>/followers')
+@bp.route('/users/<int:user_id>/followers')
 def users_followers(user_id):
     """Show list of followers of this user."""
 
@@ -177,7 +261,7 @@ def users_followers(user_id):
     return render_template('users/followers.html', user=user)
 
 
-@app.route('/users/follow/<int:follow_id>', methods=['POST'])
+@bp.route('/users/follow/<int:follow_id>', methods=['POST'])
 def add_follow(follow_id):
     """Add a follow for the currently-logged-in user."""
 
@@ -192,7 +276,7 @@ def add_follow(follow_id):
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/stop-following/<int:follow_id>', methods=['POST'])
+@bp.route('/users/stop-following/<int:follow_id>', methods=['POST'])
 def stop_following(follow_id):
     """Have currently-logged-in-user stop following this user."""
 
@@ -207,14 +291,54 @@ def stop_following(follow_id):
     return redirect(f"/users/{g.user.id}/following")
 
 
-@app.route('/users/profile', methods=["GET", "POST"])
+@bp.route('/users/profile', methods=["GET", "POST"])
 def profile():
-    """Update profile for current user."""
+    """Update profile for current user.
 
-    # IMPLEMENT THIS
+    The user must re-enter their password to confirm changes. Only the
+    fields that were changed are written.
+    """
 
+    if not g.user:
+        flash("Access unauthorized.", "danger")
+        return redirect("/")
+
+    user = g.user
+    form = UserEditForm(obj=user)
+
+    if form.validate_on_submit():
+        if not user.check_password(form.password.data):
+            flash("Wrong password, please try again.", 'danger')
+            return render_template('users/edit.html', form=form,
+                                   user_id=user.id)
 
-@app.route('/users/delete', methods=["POST"])
+        try:
+            changes = user.update_profile(
+                username=form.username.data,
+                email=form.email.data,
+                image_url=form.image_url.data or User.image_url.default.arg,
+                header_image_url=(form.header_image_url.data or
+                                  User.header_image_url.default.arg),
+                bio=form.bio.data or None,
+                location=form.location.data or None,
+            )
+            db.session.commit()
+
+        except IntegrityError:
+            db.session.rollback()
+            flash("Username or e-mail already taken", 'danger')
+            return render_template('users/edit.html', form=form,
+                                   user_id=user.id)
+
+        if changes:
+            model_changed.send(User, id=user.id, changes=changes)
+
+        return redirect(f"/users/{user.id}")
+
+    return render_template('users/edit.html', form=form, user_id=user.id)
+
+
+@bp.route('/users/delete', methods=["POST"])
 def delete_user():
     """Delete user."""
 
@@ -224,8 +348,10 @@ def delete_user():
 
     do_logout()
 
+    user_id = g.user.id
     db.session.delete(g.user)
     db.session.commit()
+    model_changed.send(User, id=user_id, changes=None)
 
     return redirect("/signup")
 
@@ -233,7 +359,7 @@ def delete_user():
 ##############################################################################
 # Messages routes:
 
-@app.route('/messages/new', methods=["GET", "POST"])
+@bp.route('/messages/new', methods=["GET", "POST"])
 def messages_add():
     """Add a message:
 
@@ -247,24 +373,46 @@ def messages_add():
     form = MessageForm()
 
     if form.validate_on_submit():
-        msg = Message(text=form.text.data)
-        g.user.messages.append(msg)
+        # Insert directly, rather than via g.user.messages, which would
+        # first load every message the user has ever posted.
+        user_id = g.user.id
+        msg = Message(text=form.text.data, user_id=user_id)
+        db.session.add(msg)
+        db.session.flush()
+
+        # Built before commit, which expires `msg` and `g.user` (reading
+        # them afterwards would cost another SELECT each).
+        posted = {
+            'message_id': msg.id,
+            'user_id': user_id,
+            'text': form.text.data,
+        }
         db.session.commit()
 
-        return redirect(f"/users/{g.user.id}")
+        # Fan-out (timelines, counters, etc.) happens in the background.
+        task_queue.enqueue('message_posted', posted)
+
+        return redirect(f"/users/{user_id}")
 
     return render_template('messages/new.html', form=form)
 
 
-@app.route('/messages/<int:message_id>', methods=["GET"])
+@bp.route('/messages/<int:message_id>', methods=["GET"])
 def messages_show(message_id):
     """Show a message."""
 
-    msg = Message.query.get(message_id)
+    # Message and author in one query, fetching only what the template uses.
+    msg = (Message
+           .query
+           .options(load_only('id', 'text', 'timestamp', 'user_id'),
+                    joinedload(Message.user, innerjoin=True)
+                    .load_only('id', 'username', 'image_url'))
+           .filter(Message.id == message_id)
+           .first_or_404())
     return render_template('messages/show.html', message=msg)
 
 
-@app.route('/messages/<int:message_id>/delete', methods=["POST"])
+@bp.route('/messages/<int:message_id>/delete', methods=["POST"])
 def messages_destroy(message_id):
     """Delete a message."""
 
@@ -283,7 +431,7 @@ def messages_destroy(message_id):
 # Homepage and error pages
 
 
-@app.route('/')
+@bp.route('/')
 def homepage():
     """Show homepage:
 
@@ -311,12 +459,10 @@ def homepage():
 #
 # https://stackoverflow.com/questions/34066804/disabling-caching-in-flask
 
-@app.after_request
+@bp.after_app_request
 def add_header(req):
     """Add non-caching headers on every request."""
 
-    req.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    req.headers["Pragma"] = "no-cache"
-    req.headers["Expires"] = "0"
-    req.headers['Cache-Control'] = 'public, max-age=0'
+    for name, value in CACHE_HEADERS:
+        req.headers[name] = value
     return req
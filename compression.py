@@ -0,0 +1,396 @@
+"""Response compression and template whitespace trimming for Warbler.
+
+Run this module as a script at build/deploy time to write precompressed
+``.gz`` (and, if the ``brotli`` package is installed, ``.br``) siblings for
+the compressible files under ``static/``:
+
+    python compression.py
+"""
+
+import gzip
+import mimetypes
+import os
+import re
+import sys
+import zlib
+from datetime import datetime
+
+from jinja2.ext import Extension
+from werkzeug.http import (
+    http_date, is_resource_modified, parse_accept_header, quote_etag,
+)
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; we fall back to gzip only
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = frozenset([
+    'text/html',
+    'text/css',
+    'text/plain',
+    'text/xml',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+    'image/x-icon',
+    'image/vnd.microsoft.icon',
+])
+
+# Static file extensions worth precompressing (images like png/jpg are
+# already compressed, so we leave those alone).
+PRECOMPRESS_EXTENSIONS = frozenset([
+    '.css', '.js', '.html', '.txt', '.json', '.svg', '.xml', '.ico',
+])
+
+# Suffix for each supported encoding, in order of preference.
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _add_vary(headers):
+    """Return `headers` with Accept-Encoding added to its Vary header."""
+
+    vary = [value for name, value in headers if name.lower() == 'vary']
+    if any('accept-encoding' in value.lower() for value in vary):
+        return headers
+
+    vary.append('Accept-Encoding')
+    headers = [(name, value) for name, value in headers
+               if name.lower() != 'vary']
+    headers.append(('Vary', ', '.join(vary)))
+    return headers
+
+
+def available_encodings():
+    """Return the content-codings we can produce, best first."""
+
+    if brotli is None:
+        return ('gzip',)
+    return ('br', 'gzip')
+
+
+def choose_encoding(accept_encoding, encodings=None):
+    """Pick best encoding from `accept_encoding` header, or None."""
+
+    if not accept_encoding:
+        return None
+
+    accept = parse_accept_header(accept_encoding)
+    best = None
+    best_quality = 0
+
+    for encoding in encodings or available_encodings():
+        quality = accept[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+class _Compressor:
+    """Incremental compressor for a single response body."""
+
+    def __init__(self, encoding, level):
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=min(level, 11))
+            self._compress = self._obj.process
+            self._finish = self._obj.finish
+        else:
+            # wbits=31 gets us a gzip container rather than raw zlib
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._compress = self._obj.compress
+            self._finish = self._obj.flush
+
+    def compress(self, data):
+        return self._compress(data)
+
+    def finish(self):
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """WSGI middleware that compresses responses and serves static files.
+
+    Dynamic responses with a compressible Content-Type are compressed as
+    they stream out, once more than `min_size` bytes have been seen
+    (smaller bodies aren't worth the CPU or the extra headers). Either
+    way they get `Vary: Accept-Encoding`, since what we send depends on it.
+
+    Requests under `static_url_path` are never compressed per request;
+    instead, if a precompressed sibling (see `precompress_static`) exists
+    for the best encoding the client accepts, it is served directly, with
+    validators from the original file and `static_headers` (which should
+    match what the app adds to its own static responses).
+    """
+
+    def __init__(self, app, static_folder=None, static_url_path='/static',
+                 min_size=500, level=6, mimetypes=COMPRESSIBLE_MIMETYPES,
+                 static_headers=()):
+        self.app = app
+        self.static_folder = static_folder
+        self.static_prefix = static_url_path.rstrip('/') + '/'
+        self.min_size = min_size
+        self.level = level
+        self.mimetypes = mimetypes
+        self.static_headers = list(static_headers)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+
+        if path.startswith(self.static_prefix):
+            return self._static_response(
+                environ, start_response, path[len(self.static_prefix):])
+
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            encoding = None
+
+        return self._compressed_response(environ, start_response, encoding)
+
+    def _static_response(self, environ, start_response, filename):
+        """Serve precompressed variant of static `filename`, if we can.
+
+        Only variants at least as new as the original count (a stale one
+        would be served under the original's validators). Of those, we
+        send the one the client prefers; this is independent of what this
+        process could compress itself, eg a .br file needs no brotli here.
+
+        Otherwise the app serves the original, with a Vary header added if
+        there are compressed variants it could have had instead.
+        """
+
+        original = None
+        if self.static_folder is not None:
+            original = safe_join(self.static_folder, filename)
+        if original is None or not os.path.isfile(original):
+            return self.app(environ, start_response)
+
+        mtime = os.path.getmtime(original)
+        variants = [(name, original + suffix)
+                    for name, suffix in ENCODING_SUFFIXES
+                    if os.path.isfile(original + suffix)
+                    and os.path.getmtime(original + suffix) >= mtime]
+        if not variants:
+            return self.app(environ, start_response)
+
+        if environ['REQUEST_METHOD'] in ('GET', 'HEAD'):
+            accept = parse_accept_header(
+                environ.get('HTTP_ACCEPT_ENCODING', ''))
+            # Highest q-value wins; ties go to ENCODING_SUFFIXES order.
+            quality, _, name, compressed = max(
+                (accept[name], -i, name, compressed)
+                for i, (name, compressed) in enumerate(variants))
+            if quality > 0:
+                return self._serve_precompressed(
+                    environ, start_response, original, compressed, name)
+
+        def _start_response(status, headers, exc_info=None):
+            return start_response(status, _add_vary(headers), exc_info)
+
+        return self.app(environ, _start_response)
+
+    def _serve_precompressed(self, environ, start_response, original,
+                             compressed, encoding):
+        """Serve `compressed`, a variant of static file `original`."""
+
+        stat = os.stat(original)
+        etag = f"{int(stat.st_mtime)}-{stat.st_size}-{encoding}"
+        last_modified = datetime.utcfromtimestamp(int(stat.st_mtime))
+
+        headers = [
+            ('ETag', quote_etag(etag)),
+            ('Last-Modified', http_date(last_modified)),
+            ('Vary', 'Accept-Encoding'),
+        ] + self.static_headers
+
+        if not is_resource_modified(environ, etag,
+                                    last_modified=last_modified):
+            start_response('304 Not Modified', headers)
+            return []
+
+        mimetype = mimetypes.guess_type(original)[0]
+        headers += [
+            ('Content-Type', mimetype or 'application/octet-stream'),
+            ('Content-Encoding', encoding),
+            ('Content-Length', str(os.path.getsize(compressed))),
+        ]
+        start_response('200 OK', headers)
+
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return wrap_file(environ, open(compressed, 'rb'))
+
+    def _negotiable(self, status, headers):
+        """Could a response with this `status` and `headers` be compressed?"""
+
+        if int(status.split(' ', 1)[0]) in (204, 206, 304):
+            return False
+
+        mimetype = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return False
+            if name == 'cache-control' and 'no-transform' in value:
+                return False
+            if name == 'content-type':
+                mimetype = value.split(';', 1)[0].strip().lower()
+
+        return mimetype in self.mimetypes
+
+    def _compressed_response(self, environ, start_response, encoding):
+        """Run the app, compressing its body on the way out if worthwhile.
+
+        We hold on to the status and headers until we know whether the
+        body crosses `min_size`, then either stream it through untouched
+        or switch to streaming compression. `encoding` is None if the
+        client doesn't accept any we support.
+        """
+
+        state = {}
+        pending = []
+
+        def _start_response(status, headers, exc_info=None):
+            state['status'] = status
+            state['headers'] = headers
+            state['exc_info'] = exc_info
+            return pending.append
+
+        app_iter = self.app(environ, _start_response)
+
+        try:
+            headers = state['headers']
+
+            if not self._negotiable(state['status'], headers):
+                start_response(state['status'], headers, state['exc_info'])
+                for chunk in pending:
+                    yield chunk
+                for chunk in app_iter:
+                    yield chunk
+                return
+
+            headers = _add_vary(headers)
+
+            length = [int(value) for name, value in headers
+                      if name.lower() == 'content-length']
+            if encoding is None or (length and length[0] < self.min_size):
+                start_response(state['status'], headers, state['exc_info'])
+                for chunk in pending:
+                    yield chunk
+                for chunk in app_iter:
+                    yield chunk
+                return
+
+            body_iter = iter(app_iter)
+            buffered = sum(len(chunk) for chunk in pending)
+
+            for chunk in body_iter:
+                pending.append(chunk)
+                buffered += len(chunk)
+                if buffered >= self.min_size:
+                    break
+            else:
+                start_response(state['status'], headers, state['exc_info'])
+                for chunk in pending:
+                    yield chunk
+                return
+
+            headers = [(name, value) for name, value in headers
+                       if name.lower() != 'content-length']
+            headers.append(('Content-Encoding', encoding))
+            start_response(state['status'], headers, state['exc_info'])
+
+            compressor = _Compressor(encoding, self.level)
+            for chunk in pending:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            for chunk in body_iter:
+                data = compressor.compress(chunk)
+                if data:
+                    yield data
+            yield compressor.finish()
+
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+##############################################################################
+# Template whitespace trimming
+
+
+class WhitespaceTrimExtension(Extension):
+    """Strip indentation and blank lines from template source.
+
+    This runs once per template at compile time, so there's no per-render
+    cost. It is not aware of <pre> or <textarea>, so don't enable it for
+    templates that put literal whitespace inside those.
+    """
+
+    _leading = re.compile(r'^[ \t]+', re.MULTILINE)
+    _blank_lines = re.compile(r'\n{2,}')
+
+    def preprocess(self, source, name, filename=None):
+        source = self._leading.sub('', source)
+        return self._blank_lines.sub('\n', source)
+
+
+def trim_template_whitespace(app):
+    """Configure `app`'s Jinja environment to emit minimal whitespace."""
+
+    app.jinja_env.trim_blocks = True
+    app.jinja_env.lstrip_blocks = True
+    app.jinja_env.add_extension(WhitespaceTrimExtension)
+
+
+##############################################################################
+# Build-time static precompression
+
+
+def precompress_static(static_folder, level=9):
+    """Write .gz/.br siblings for compressible files in `static_folder`.
+
+    Files are only rewritten when the original is newer than the existing
+    compressed copy. Returns list of paths written.
+    """
+
+    written = []
+
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() not in PRECOMPRESS_EXTENSIONS:
+                continue
+
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            outputs = [('.gz', lambda: gzip.compress(data, level))]
+            if brotli is not None:
+                outputs.append(
+                    ('.br', lambda: brotli.compress(data, quality=11)))
+
+            for suffix, compress in outputs:
+                target = path + suffix
+                if (os.path.exists(target) and
+                        os.path.getmtime(target) >= os.path.getmtime(path)):
+                    continue
+                with open(target, 'wb') as f:
+                    f.write(compress())
+                written.append(target)
+
+    return written
+
+
+if __name__ == '__main__':
+    folder = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'static')
+
+    for path in precompress_static(folder):
+        print(path)
@@ -0,0 +1,111 @@
+"""Configuration objects for Warbler.
+
+Pass one of these (or its name, as found in `configs`) to `create_app`.
+"""
+
+import os
+
+
+class Config:
+    """Settings shared by every environment."""
+
+    # Get DB_URI from environ variable (useful for production/testing) or,
+    # if not set there, use development local db.
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', 'postgresql:///warbler')
+
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SECRET_KEY = os.environ.get('SECRET_KEY', "it's a secret")
+
+    # Debug toolbar is only imported & installed when this is on.
+    DEBUG_TB_ENABLED = False
+    DEBUG_TB_INTERCEPT_REDIRECTS = True
+
+    # Responses smaller than this many bytes are sent uncompressed.
+    COMPRESS_MIN_SIZE = 500
+    COMPRESS_LEVEL = 6
+    TEMPLATES_TRIM_WHITESPACE = (
+        os.environ.get('TEMPLATES_TRIM_WHITESPACE', '1') == '1')
+
+    # Token-bucket limits on POSTs to these endpoints; see ratelimit.py.
+    # Signup and login are limited by IP since they're anonymous (and each
+    # costs a bcrypt hash, as does the password check on profile edits).
+    RATELIMIT_ENABLED = True
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+    # How many reverse proxies (that set X-Forwarded-For) sit in front of
+    # the app; without this, limits by IP see only the proxy's address.
+    RATELIMIT_TRUSTED_PROXIES = int(
+        os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+    RATELIMIT_LIMITS = {
+        'warbler.signup': ['ip:5/minute', 'ip:50/day'],
+        'warbler.login': ['ip:10/minute'],
+        'warbler.messages_add': ['user:10/minute', 'ip:30/minute'],
+        'warbler.add_follow': ['user:30/minute', 'ip:60/minute'],
+        'warbler.profile': ['user:5/minute', 'ip:10/minute'],
+    }
+
+    # Background tasks (see tasks.py): gather up to TASKS_BATCH_SIZE items
+    # arriving within TASKS_BATCH_WAIT seconds into one handler call.
+    TASKS_EAGER = False
+    TASKS_BATCH_SIZE = 500
+    TASKS_BATCH_WAIT = 0.05
+    TASKS_MAX_ATTEMPTS = 5
+    # Failed batches are retried after 1, 2, 4, ... times this many seconds.
+    TASKS_RETRY_DELAY = 1.0
+    # Longest we'll wait for queued tasks to finish when shutting down.
+    TASKS_DRAIN_TIMEOUT = 10.0
+
+    # Cache compiled Jinja bytecode on disk, shared between workers so only
+    # the first one to render a template pays to compile it. The directory
+    # must be private to the app's user; None uses Jinja's per-user default.
+    TEMPLATE_BYTECODE_CACHE = False
+    TEMPLATE_BYTECODE_CACHE_DIR = os.environ.get(
+        'TEMPLATE_BYTECODE_CACHE_DIR')
+
+
+class DevelopmentConfig(Config):
+    """Local development: debug toolbar on."""
+
+    DEBUG = True
+    DEBUG_TB_ENABLED = True
+
+
+class TestingConfig(Config):
+    """Running the test suite."""
+
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'TEST_DATABASE_URL', 'postgresql:///warbler-test')
+
+    # Don't have WTForms use CSRF at all, since it's a pain to test
+    WTF_CSRF_ENABLED = False
+
+    # Tests share an app; ratelimit tests turn this back on.
+    RATELIMIT_ENABLED = False
+
+    # Run task handlers inline, inside the test's transaction.
+    TASKS_EAGER = True
+
+    # Minimum bcrypt cost: hashing at the default (12) dominates test time.
+    BCRYPT_LOG_ROUNDS = 4
+
+
+class UnitTestConfig(TestingConfig):
+    """Fast unit tests, against an in-memory SQLite database."""
+
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+
+class ProductionConfig(Config):
+    """Production: never load the debug toolbar."""
+
+    TEMPLATE_BYTECODE_CACHE = True
+
+
+configs = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'unittest': UnitTestConfig,
+    'production': ProductionConfig,
+}
@@ -2,12 +2,22 @@
 
 from datetime import datetime
 
+from flask import current_app
+from flask.signals import Namespace
 from flask_bcrypt import Bcrypt
 from flask_sqlalchemy import SQLAlchemy
 
 bcrypt = Bcrypt()
 db = SQLAlchemy()
 
+_signals = Namespace()
+
+# Sent (with the model class as sender) after a change to a row has been
+# committed, so caches of that row (user snapshots, rendered fragments,
+# ETags) can invalidate themselves. Receivers get `id` and `changes`, a
+# dict of column -> new value; `changes` is None if the row was deleted.
+model_changed = _signals.signal('model-changed')
+
 
 class Follows(db.Model):
     """Connection of a follower <-> followed_user."""
@@ -137,7 +147,12 @@ class User(db.Model):
         Hashes password and adds user to system.
         """
 
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        # Cost comes from the current app's config, not the shared bcrypt
+        # object, so apps with different settings don't affect each other.
+        rounds = current_app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        hashed_pwd = (bcrypt
+                      .generate_password_hash(password, rounds)
+                      .decode('UTF-8'))
 
         user = User(
             username=username,
@@ -162,13 +177,35 @@ class User(db.Model):
 
         user = cls.query.filter_by(username=username).first()
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 
+    def check_password(self, password):
+        """Does `password` match this user's password hash?"""
+
+        return bcrypt.check_password_hash(self.password, password)
+
+    def update_profile(self, **fields):
+        """Update this user's profile with `fields`.
+
+        Only columns whose values actually differ are written, in a single
+        UPDATE. Returns a dict of the changed columns (empty if nothing
+        changed). The caller is responsible for committing.
+        """
+
+        changes = {name: value for name, value in fields.items()
+                   if getattr(self, name) != value}
+
+        if changes:
+            (User
+             .query
+             .filter(User.id == self.id)
+             .update(changes, synchronize_session='evaluate'))
+
+        return changes
+
 
 class Message(db.Model):
     """An individual message ("warble")."""
@@ -203,8 +240,9 @@ class Message(db.Model):
 def connect_db(app):
     """Connect this database to provided Flask app.
 
-    You should call this in your Flask app.
+    You should call this in your Flask app. This doesn't bind `db` to
+    `app` globally, so code using the db outside of a request (scripts,
+    tests) needs to push an app context first.
     """
 
-    db.app = app
     db.init_app(app)
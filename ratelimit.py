@@ -0,0 +1,263 @@
+"""Token-bucket rate limiting for Warbler's write endpoints.
+
+Limits are set per endpoint in the RATELIMIT_LIMITS config, eg:
+
+    RATELIMIT_LIMITS = {
+        'warbler.login': ['ip:10/minute'],
+        'warbler.messages_add': ['user:10/minute', 'ip:30/minute'],
+    }
+
+Each rule is "<scope>:<count>/<period>", where scope is "user" (the
+logged-in user id from the session; anonymous requests skip these) or
+"ip". A bucket holds up to <count> tokens and refills at <count> per
+<period>; a request is allowed only if every bucket that applies has a
+token, and then takes one from each.
+
+Behind a reverse proxy, set RATELIMIT_TRUSTED_PROXIES (see `client_ip`),
+or every client will be limited as the proxy's IP address.
+
+Buckets are kept in-process by default. Set RATELIMIT_STORAGE_URL to a
+redis:// URL (needs the `redis` package) to share them between workers.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, request
+
+try:
+    import redis
+except ImportError:  # only needed for a shared store
+    redis = None
+
+
+PERIODS = {
+    'second': 1,
+    'minute': 60,
+    'hour': 60 * 60,
+    'day': 60 * 60 * 24,
+}
+
+SCOPES = ('user', 'ip')
+
+
+def parse_limit(rule):
+    """Parse "scope:count/period" into (scope, capacity, seconds)."""
+
+    try:
+        scope, limit = rule.split(':', 1)
+        count, period = limit.split('/', 1)
+        capacity = int(count)
+        seconds = PERIODS[period.strip().rstrip('s')]
+    except (ValueError, KeyError):
+        raise ValueError(f"Bad rate limit {rule!r}")
+
+    if scope not in SCOPES or capacity < 1:
+        raise ValueError(f"Bad rate limit {rule!r}")
+
+    return scope, capacity, seconds
+
+
+class MemoryStore:
+    """Token buckets in a dict, for a single process.
+
+    At most `max_keys` buckets are kept; beyond that the least recently
+    used ones are forgotten (a forgotten bucket starts out full again),
+    so both memory and the cost of a check stay bounded.
+    """
+
+    max_keys = 10000
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets, now=None):
+        """Take a token from each of `buckets` if they all have one.
+
+        `buckets` is a list of (key, capacity, seconds). Returns 0 if
+        allowed, else the number of seconds until every bucket will have a
+        token; in that case no tokens are taken.
+        """
+
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            levels = []
+            wait = 0
+
+            for key, capacity, seconds in buckets:
+                rate = capacity / seconds
+                tokens, last = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - last) * rate)
+                levels.append((key, tokens))
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+
+            taken = 0 if wait else 1
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - taken, now)
+                self._buckets.move_to_end(key)
+
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """Token buckets in redis, shared by every worker using the same URL."""
+
+    # Refill all buckets, then take from all of them or none, atomically
+    # on the redis server. ARGV is now, then capacity & rate per key.
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local levels = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        local bucket = redis.call('HMGET', key, 'tokens', 'last')
+        local tokens = tonumber(bucket[1]) or capacity
+        local last = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - last) * rate)
+        levels[i] = tokens
+        if tokens < 1 then
+            wait = math.max(wait, (1 - tokens) / rate)
+        end
+    end
+    local taken = 1
+    if wait > 0 then
+        taken = 0
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        redis.call('HSET', key, 'tokens', levels[i] - taken, 'last', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate))
+    end
+    return tostring(wait)
+    """
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("RedisStore needs the 'redis' package")
+
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self.SCRIPT)
+
+    def take(self, buckets, now=None):
+        """Take a token from each of `buckets`; see `MemoryStore.take`."""
+
+        if now is None:
+            now = time.time()
+
+        keys = []
+        args = [now]
+        for key, capacity, seconds in buckets:
+            keys.append('warbler:ratelimit:'
+                        + ':'.join(str(part) for part in key))
+            args += [capacity, capacity / seconds]
+
+        return float(self._take(keys=keys, args=args))
+
+    def clear(self):
+        for key in self._client.scan_iter('warbler:ratelimit:*'):
+            self._client.delete(key)
+
+
+def client_ip():
+    """Return IP address of the client making the current request.
+
+    Behind reverse proxies, `request.remote_addr` is the nearest proxy, so
+    every client would share one bucket. Set RATELIMIT_TRUSTED_PROXIES to
+    the number of proxies in front of the app and we'll use the address
+    that the outermost of them saw, from X-Forwarded-For. (Entries further
+    left than that are client-supplied and can't be trusted.)
+    """
+
+    depth = current_app.config['RATELIMIT_TRUSTED_PROXIES']
+    if depth:
+        forwarded = [addr.strip() for addr
+                     in request.headers.get('X-Forwarded-For', '').split(',')
+                     if addr.strip()]
+        if len(forwarded) >= depth:
+            return forwarded[-depth]
+
+    return request.remote_addr
+
+
+class RateLimiter:
+    """Flask extension applying RATELIMIT_LIMITS before each request.
+
+    `get_user_id` is called (during a request) to find the logged-in user's
+    id for "user" limits; it should return None for anonymous requests.
+    """
+
+    def __init__(self, get_user_id, app=None):
+        self.get_user_id = get_user_id
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('RATELIMIT_ENABLED', True)
+        app.config.setdefault('RATELIMIT_STORAGE_URL', None)
+        app.config.setdefault('RATELIMIT_METHODS', ('POST',))
+        app.config.setdefault('RATELIMIT_LIMITS', {})
+        app.config.setdefault('RATELIMIT_TRUSTED_PROXIES', 0)
+
+        # Parse everything up front, so a typo fails at startup and the
+        # per-request check is just a dict lookup.
+        config_limits = app.config['RATELIMIT_LIMITS']
+        limits = {endpoint: [parse_limit(rule) for rule in rules]
+                  for endpoint, rules in config_limits.items()}
+
+        url = app.config['RATELIMIT_STORAGE_URL']
+        store = RedisStore(url) if url else MemoryStore()
+
+        app.extensions['ratelimit'] = (store, limits)
+        app.before_request(self._check)
+
+    def _check(self):
+        """Return a 429 response if this request is over any limit."""
+
+        if not current_app.config['RATELIMIT_ENABLED']:
+            return None
+        if request.method not in current_app.config['RATELIMIT_METHODS']:
+            return None
+
+        store, limits = current_app.extensions['ratelimit']
+        rules = limits.get(request.endpoint)
+        if not rules:
+            return None
+
+        identities = {
+            'user': self.get_user_id(),
+            'ip': client_ip(),
+        }
+
+        buckets = []
+        for scope, capacity, seconds in rules:
+            identity = identities[scope]
+            if identity is None:
+                continue
+            key = (f"{request.endpoint}:{scope}:{identity}", capacity, seconds)
+            buckets.append((key, capacity, seconds))
+
+        # One request takes from all its buckets or none, so being over a
+        # per-user limit doesn't also drain the IP's (shared) bucket.
+        wait = store.take(buckets) if buckets else 0
+
+        if wait:
+            retry_after = str(math.ceil(wait))
+            return ("Too many requests. Please slow down.", 429,
+                    {'Retry-After': retry_after})
+
+        return None
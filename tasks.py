@@ -0,0 +1,243 @@
+"""Background task queue for work that shouldn't block a request.
+
+Views enqueue named events after committing their own write:
+
+    task_queue.enqueue('message_posted', {'message_id': msg.id, ...})
+
+and handlers subscribe to them:
+
+    @task_queue.handler('message_posted')
+    def index_hashtags(payloads):
+        ...
+
+A handler is always called with a *list* of payloads: the worker thread
+collects everything enqueued within TASKS_BATCH_WAIT seconds (up to
+TASKS_BATCH_SIZE items), so a handler can turn a burst of posts into a
+single multi-row INSERT/UPDATE. Handlers run in an app context.
+
+Delivery is at-least-once for the life of the process: if a handler
+raises, its whole batch is retried (up to TASKS_MAX_ATTEMPTS times, with
+exponential backoff starting at TASKS_RETRY_DELAY seconds, so a brief
+database outage doesn't use up every attempt), so handlers must be
+idempotent. On shutdown the queue is drained, for up to
+TASKS_DRAIN_TIMEOUT seconds, before the process exits. Work still queued
+when a process is killed outright is lost; anything that must survive
+that belongs in the database.
+
+With TASKS_EAGER on (as in tests), handlers run inline in `enqueue`.
+"""
+
+import atexit
+import heapq
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Put on the queue to tell the worker to finish up and exit.
+_STOP = object()
+
+
+class _Worker:
+    """Thread that pulls batches of tasks for one app and runs them."""
+
+    def __init__(self, app, handlers):
+        self.app = app
+        self.handlers = handlers
+        self.batch_size = app.config['TASKS_BATCH_SIZE']
+        self.batch_wait = app.config['TASKS_BATCH_WAIT']
+        self.max_attempts = app.config['TASKS_MAX_ATTEMPTS']
+        self.retry_delay = app.config['TASKS_RETRY_DELAY']
+
+        self._queue = queue.Queue()
+        # Failed items waiting to be retried, as (due, seq, item); only
+        # touched by the worker thread.
+        self._delayed = []
+        self._seq = itertools.count()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def put(self, name, payload):
+        self._ensure_started()
+        self._queue.put((name, payload, 1))
+
+    def _ensure_started(self):
+        """Start the thread on first use (and again in a forked child)."""
+
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name='warbler-tasks', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+
+        while True:
+            batch, stopping = self._next_batch(stopping)
+            if batch:
+                self._process(batch)
+            elif stopping and not self._delayed:
+                return
+
+    def _due_retries(self):
+        """Pop retries whose backoff has expired."""
+
+        batch = []
+        now = time.monotonic()
+        while (self._delayed and self._delayed[0][0] <= now
+               and len(batch) < self.batch_size):
+            batch.append(heapq.heappop(self._delayed)[2])
+        return batch
+
+    def _until_next_retry(self):
+        """Seconds until the next retry is due, or None if there are none."""
+
+        if not self._delayed:
+            return None
+        return max(0, self._delayed[0][0] - time.monotonic())
+
+    def _next_batch(self, stopping):
+        """Collect a batch of tasks; returns (batch, stopping)."""
+
+        batch = self._due_retries()
+
+        if stopping:
+            # Draining: take whatever's left, without waiting.
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    batch.append(item)
+            if not batch and self._delayed:
+                time.sleep(self._until_next_retry())
+            return batch, True
+
+        if not batch:
+            try:
+                item = self._queue.get(timeout=self._until_next_retry())
+            except queue.Empty:
+                return batch, False
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+
+        return batch, False
+
+    def _process(self, batch):
+        """Run handlers for `batch`, grouped by name, requeueing failures."""
+
+        by_name = {}
+        for item in batch:
+            by_name.setdefault(item[0], []).append(item)
+
+        with self.app.app_context():
+            for name, items in by_name.items():
+                payloads = [payload for _, payload, _ in items]
+                try:
+                    for handler in self.handlers.get(name, ()):
+                        handler(payloads)
+                except Exception:
+                    logger.exception("Task %r failed for %d item(s)",
+                                     name, len(items))
+                    self._retry(items)
+
+    def _retry(self, items):
+        """Schedule `items` to run again, after a backoff."""
+
+        for name, payload, attempts in items:
+            if attempts >= self.max_attempts:
+                logger.error("Giving up on task %r: %r", name, payload)
+                continue
+
+            due = time.monotonic() + self.retry_delay * 2 ** (attempts - 1)
+            item = (name, payload, attempts + 1)
+            heapq.heappush(self._delayed, (due, next(self._seq), item))
+
+    def drain(self, timeout=None):
+        """Process everything still queued, then stop the thread."""
+
+        if self._thread is None or self._pid != os.getpid():
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+
+class TaskQueue:
+    """Flask extension holding task handlers and each app's worker."""
+
+    def __init__(self, app=None):
+        self.handlers = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('TASKS_EAGER', False)
+        app.config.setdefault('TASKS_BATCH_SIZE', 500)
+        app.config.setdefault('TASKS_BATCH_WAIT', 0.05)
+        app.config.setdefault('TASKS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('TASKS_RETRY_DELAY', 1.0)
+        app.config.setdefault('TASKS_DRAIN_TIMEOUT', 10.0)
+
+        worker = _Worker(app, self.handlers)
+        app.extensions['tasks'] = worker
+        # Bounded, so a hung handler can't stop the process from exiting.
+        atexit.register(worker.drain, app.config['TASKS_DRAIN_TIMEOUT'])
+
+    def handler(self, name):
+        """Decorator: subscribe a function to tasks called `name`."""
+
+        def register(func):
+            self.handlers.setdefault(name, []).append(func)
+            return func
+
+        return register
+
+    def enqueue(self, name, payload):
+        """Queue `payload` for the `name` handlers."""
+
+        if name not in self.handlers:
+            return
+
+        if current_app.config['TASKS_EAGER']:
+            for handler in self.handlers.get(name, ()):
+                handler([payload])
+            return
+
+        current_app.extensions['tasks'].put(name, payload)
+
+    def drain(self, timeout=None):
+        """Run everything queued for the current app, and stop its worker."""
+
+        current_app.extensions['tasks'].drain(timeout)
+
+
+task_queue = TaskQueue()
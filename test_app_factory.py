@@ -0,0 +1,94 @@
+"""App factory tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_app_factory.py
+
+
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from app import create_app
+from config import TestingConfig, DevelopmentConfig, ProductionConfig
+
+# Import-time budgets, in seconds, measured inside a fresh interpreter
+# (so interpreter startup isn't counted). IMPORT_TIME_BUDGET covers all
+# of `import app`, which is what each prefork worker pays before it can
+# serve. OWN_IMPORT_TIME_BUDGET covers our own modules once the framework
+# packages are loaded (normally ~15ms), so a new heavy import fails it.
+IMPORT_TIME_BUDGET = 1.0
+OWN_IMPORT_TIME_BUDGET = 0.1
+
+# Imported before timing our own modules.
+FRAMEWORK_MODULES = (
+    "flask, flask_sqlalchemy, flask_bcrypt, flask_wtf, wtforms, sqlalchemy")
+
+TIME_IMPORT = """
+import sys, time
+{preload}
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start, 'flask_debugtoolbar' in sys.modules)
+"""
+
+
+def time_import(preload=""):
+    """Time `import app` in a child interpreter.
+
+    Returns (seconds, whether the debug toolbar got imported).
+    """
+
+    out = subprocess.run(
+        [sys.executable, "-c", TIME_IMPORT.format(preload=preload)],
+        check=True, stdout=subprocess.PIPE, universal_newlines=True,
+    ).stdout
+    elapsed, toolbar = out.split()
+    return float(elapsed), toolbar == "True"
+
+
+class AppFactoryTestCase(TestCase):
+    """Test create_app and what importing the app module costs."""
+
+    def test_import_is_cheap(self):
+        elapsed, toolbar = time_import()
+
+        self.assertFalse(toolbar)
+        self.assertLess(elapsed, IMPORT_TIME_BUDGET)
+
+    def test_own_modules_import_is_cheap(self):
+        elapsed, _ = time_import(f"import {FRAMEWORK_MODULES}")
+        self.assertLess(elapsed, OWN_IMPORT_TIME_BUDGET)
+
+    def test_isolated_apps(self):
+        app1 = create_app(TestingConfig)
+        app2 = create_app(TestingConfig)
+
+        self.assertIsNot(app1, app2)
+        self.assertTrue(app1.testing)
+        self.assertFalse(app1.config['WTF_CSRF_ENABLED'])
+
+    def test_toolbar_only_in_development(self):
+        self.assertNotIn('debugtoolbar', create_app(ProductionConfig).blueprints)
+        self.assertIn('debugtoolbar', create_app(DevelopmentConfig).blueprints)
+
+    def test_config_by_name(self):
+        app = create_app('testing')
+        self.assertTrue(app.testing)
+
+    def test_bytecode_cache_dir_must_be_private(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            private = os.path.join(tmp, "private")
+            config = type("CachedConfig", (TestingConfig,), {
+                "TEMPLATE_BYTECODE_CACHE": True,
+                "TEMPLATE_BYTECODE_CACHE_DIR": private,
+            })
+
+            create_app(config)
+            self.assertEqual(os.stat(private).st_mode & 0o777, 0o700)
+
+            os.chmod(private, 0o777)
+            with self.assertRaises(RuntimeError):
+                create_app(config)
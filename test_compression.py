@@ -0,0 +1,169 @@
+"""Compression middleware tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_compression.py
+
+
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from compression import CompressionMiddleware, choose_encoding, precompress_static
+
+
+def make_app(body, mimetype='text/html'):
+    """Make a tiny WSGI app that always returns `body`."""
+
+    def app(environ, start_response):
+        return Response(body, mimetype=mimetype)(environ, start_response)
+
+    return app
+
+
+def make_static_app(folder):
+    """Make a tiny WSGI app serving files under /static/ from `folder`."""
+
+    def app(environ, start_response):
+        path = os.path.join(folder, environ['PATH_INFO'][len('/static/'):])
+        if not os.path.isfile(path):
+            return Response("not found", 404)(environ, start_response)
+        with open(path) as f:
+            body = f.read()
+        return Response(body, mimetype='text/css')(environ, start_response)
+
+    return app
+
+
+class CompressionMiddlewareTestCase(TestCase):
+    """Test compression negotiation and thresholds."""
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip', ('gzip',)), 'gzip')
+        self.assertEqual(choose_encoding('br;q=0, gzip', ('br', 'gzip')), 'gzip')
+        self.assertIsNone(choose_encoding('identity', ('gzip',)))
+        self.assertIsNone(choose_encoding(None))
+
+    def test_compresses_large_html(self):
+        body = "<p>hello</p>\n" * 200
+        client = Client(CompressionMiddleware(make_app(body)), Response)
+
+        resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+        self.assertNotIn('Content-Length', resp.headers)
+        self.assertEqual(gzip.decompress(resp.data).decode(), body)
+
+    def test_skips_small_and_unaccepted(self):
+        client = Client(CompressionMiddleware(make_app("tiny")), Response)
+        resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(resp.data, b"tiny")
+
+        body = "x" * 2000
+        client = Client(CompressionMiddleware(make_app(body)), Response)
+        resp = client.get('/')
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+
+    def test_skips_incompressible_mimetype(self):
+        body = b"\x89PNG" * 500
+        client = Client(
+            CompressionMiddleware(make_app(body, 'image/png')), Response)
+
+        resp = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertNotIn('Content-Encoding', resp.headers)
+        self.assertEqual(resp.data, body)
+
+    def test_serves_precompressed_static(self):
+        with tempfile.TemporaryDirectory() as static:
+            css = "body { color: red; }\n" * 100
+            with open(os.path.join(static, 'style.css'), 'w') as f:
+                f.write(css)
+
+            written = precompress_static(static)
+            self.assertIn(os.path.join(static, 'style.css.gz'), written)
+
+            app = CompressionMiddleware(
+                make_static_app(static), static_folder=static)
+            client = Client(app, Response)
+
+            resp = client.get('/static/style.css', buffered=True,
+                              headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(resp.headers['Content-Type'], 'text/css')
+            self.assertEqual(gzip.decompress(resp.data).decode(), css)
+
+            # conditional requests get a 304, by ETag or date
+            resp2 = client.get('/static/style.css', headers={
+                'Accept-Encoding': 'gzip',
+                'If-None-Match': resp.headers['ETag'],
+            })
+            self.assertEqual(resp2.status_code, 304)
+            self.assertEqual(resp2.data, b"")
+
+            resp2 = client.get('/static/style.css', headers={
+                'Accept-Encoding': 'gzip',
+                'If-Modified-Since': resp.headers['Last-Modified'],
+            })
+            self.assertEqual(resp2.status_code, 304)
+
+            # not accepted: the app serves it, but the response still varies
+            resp = client.get('/static/style.css')
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.headers['Vary'], 'Accept-Encoding')
+
+            # no such file: falls through to the app
+            resp = client.get('/static/missing.css',
+                              headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(resp.status_code, 404)
+
+            # original edited since precompressing: the stale .gz is
+            # ignored and the app serves the fresh original
+            fresh = "body { color: blue; }\n" * 100
+            path = os.path.join(static, 'style.css')
+            with open(path, 'w') as f:
+                f.write(fresh)
+            mtime = os.path.getmtime(path + '.gz') + 10
+            os.utime(path, (mtime, mtime))
+
+            resp = client.get('/static/style.css',
+                              headers={'Accept-Encoding': 'gzip'})
+            self.assertNotIn('Content-Encoding', resp.headers)
+            self.assertEqual(resp.data.decode(), fresh)
+
+    def test_static_negotiates_existing_variants(self):
+        with tempfile.TemporaryDirectory() as static:
+            path = os.path.join(static, 'style.css')
+            with open(path, 'w') as f:
+                f.write("body { color: red; }\n" * 100)
+            precompress_static(static)
+
+            # A .br file is served even if this process has no brotli.
+            with open(path + '.br', 'wb') as f:
+                f.write(b"brotli bytes")
+
+            client = Client(CompressionMiddleware(
+                make_static_app(static), static_folder=static), Response)
+
+            resp = client.get('/static/style.css', buffered=True,
+                              headers={'Accept-Encoding': 'br'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'br')
+            self.assertEqual(resp.data, b"brotli bytes")
+
+            # the client's q-values beat our order of preference
+            resp = client.get('/static/style.css', buffered=True, headers={
+                'Accept-Encoding': 'br;q=0.5, gzip;q=1.0',
+            })
+            self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+
+            resp = client.get('/static/style.css', buffered=True,
+                              headers={'Accept-Encoding': 'gzip, br'})
+            self.assertEqual(resp.headers['Content-Encoding'], 'br')
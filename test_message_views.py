@@ -3,53 +3,27 @@
 # run these tests like:
 #
 #    FLASK_ENV=production python -m unittest test_message_views.py
+#
+# or, one test database per worker, in parallel:
+#
+#    python -m pytest -n auto
 
 
-import os
-from unittest import TestCase
-
-from models import db, connect_db, Message, User
-
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
-
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
-
-
-# Now we can import app
-
-from app import app, CURR_USER_KEY
-
-# Create our tables (we do this here, so we only create the tables
-# once for all tests --- in each test, we'll delete the data
-# and create fresh new clean test data
-
-db.create_all()
-
-# Don't have WTForms use CSRF at all, since it's a pain to test
-
-app.config['WTF_CSRF_ENABLED'] = False
+from app import CURR_USER_KEY
+from models import Message
+from tasks import task_queue
+from testing import DBTestCase
 
 
-class MessageViewTestCase(TestCase):
+class MessageViewTestCase(DBTestCase):
     """Test views for messages."""
 
     def setUp(self):
-        """Create test client, add sample data."""
-
-        User.query.delete()
-        Message.query.delete()
-
-        self.client = app.test_client()
-
-        self.testuser = User.signup(username="testuser",
-                                    email="test@test.com",
-                                    password="testuser",
-                                    image_url=None)
+        """Create test client, find fixture user."""
 
-        db.session.commit()
+        super().setUp()
+        self.client = self.app.test_client()
+        self.testuser = self.fixture_user("testuser")
 
     def test_add_message(self):
         """Can use add a message?"""
@@ -69,5 +43,43 @@ class MessageViewTestCase(TestCase):
             # Make sure it redirects
             self.assertEqual(resp.status_code, 302)
 
-            msg = Message.query.one()
+            msg = Message.query.filter_by(user_id=self.testuser.id).one()
             self.assertEqual(msg.text, "Hello")
+
+    def test_add_message_queues_fanout(self):
+        """Does posting queue a message_posted task?"""
+
+        posted = []
+        task_queue.handler('message_posted')(posted.extend)
+        self.addCleanup(task_queue.handlers['message_posted'].remove,
+                        posted.extend)
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.post("/messages/new", data={"text": "Fan me out"})
+
+        msg = Message.query.filter_by(user_id=self.testuser.id).one()
+        self.assertEqual(posted, [{
+            'message_id': msg.id,
+            'user_id': self.testuser.id,
+            'text': "Fan me out",
+        }])
+
+    def test_show_message(self):
+        """Does message page show message and author?"""
+
+        msg = Message.query.filter_by(text="Hello from otheruser").one()
+
+        resp = self.client.get(f"/messages/{msg.id}")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"Hello from otheruser", resp.data)
+        self.assertIn(b"@otheruser", resp.data)
+
+    def test_show_missing_message(self):
+        """Is a missing message a 404?"""
+
+        resp = self.client.get("/messages/999999")
+        self.assertEqual(resp.status_code, 404)
@@ -0,0 +1,140 @@
+"""Rate limiter tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_ratelimit.py
+
+
+from unittest import TestCase
+
+from app import create_app, CURR_USER_KEY
+from config import UnitTestConfig
+from ratelimit import MemoryStore, parse_limit
+from testing import DBTestCase
+
+
+class LimitedConfig(UnitTestConfig):
+    RATELIMIT_ENABLED = True
+    RATELIMIT_LIMITS = {
+        'warbler.login': ['ip:2/minute'],
+        'warbler.profile': ['user:2/minute'],
+    }
+
+
+class TokenBucketTestCase(TestCase):
+    """Test limit parsing and the in-process bucket store."""
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit("ip:10/minute"), ("ip", 10, 60))
+        self.assertEqual(parse_limit("user:5/hours"), ("user", 5, 3600))
+
+        bad_rules = ("10/minute", "ip:10/fortnight", "host:1/second",
+                     "ip:0/day")
+        for bad in bad_rules:
+            with self.assertRaises(ValueError):
+                parse_limit(bad)
+
+    def test_bucket_empties_and_refills(self):
+        store = MemoryStore()
+        bucket = [("k", 2, 60)]
+
+        self.assertEqual(store.take(bucket, now=0), 0)
+        self.assertEqual(store.take(bucket, now=0), 0)
+        self.assertAlmostEqual(store.take(bucket, now=0), 30)
+
+        # refills at 2 tokens / 60 seconds
+        self.assertAlmostEqual(store.take(bucket, now=15), 15)
+        self.assertEqual(store.take(bucket, now=30), 0)
+
+    def test_denied_request_takes_no_tokens(self):
+        store = MemoryStore()
+        user = ("user", 1, 60)
+        ip = ("ip", 2, 60)
+
+        self.assertEqual(store.take([user, ip], now=0), 0)
+        self.assertAlmostEqual(store.take([user, ip], now=0), 60)
+        self.assertAlmostEqual(store.take([user, ip], now=0), 60)
+
+        # user's refused requests left the IP bucket its last token
+        self.assertEqual(store.take([ip], now=0), 0)
+        self.assertAlmostEqual(store.take([ip], now=0), 30)
+
+    def test_bounded_lru(self):
+        store = MemoryStore()
+        store.max_keys = 2
+
+        store.take([("a", 1, 60)], now=0)
+        store.take([("b", 1, 60)], now=0)
+        store.take([("a", 1, 60)], now=0)
+        store.take([("c", 1, 60)], now=0)
+
+        # b was least recently used
+        self.assertEqual(list(store._buckets), ["a", "c"])
+
+
+class RateLimitViewTestCase(TestCase):
+    """Test limits are applied to requests."""
+
+    def test_login_limited(self):
+        client = create_app(LimitedConfig).test_client()
+        data = {"username": "testuser", "password": "x"}
+
+        self.assertEqual(client.get("/login").status_code, 200)
+        self.assertEqual(client.post("/login", data=data).status_code, 200)
+        self.assertEqual(client.post("/login", data=data).status_code, 200)
+
+        resp = client.post("/login", data=data)
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers["Retry-After"], "30")
+
+        # GETs are never limited
+        self.assertEqual(client.get("/login").status_code, 200)
+
+    def test_trusted_proxy(self):
+        config = type("ProxiedConfig", (LimitedConfig,), {
+            "RATELIMIT_TRUSTED_PROXIES": 1,
+        })
+        client = create_app(config).test_client()
+        data = {"username": "testuser", "password": "x"}
+
+        def login(forwarded_for):
+            return client.post("/login", data=data, headers={
+                "X-Forwarded-For": forwarded_for,
+            }).status_code
+
+        self.assertEqual(login("1.1.1.1"), 200)
+        self.assertEqual(login("1.1.1.1"), 200)
+        self.assertEqual(login("1.1.1.1"), 429)
+
+        # a different client behind the same proxy has its own bucket,
+        # and can't dodge its limit with a spoofed leftmost entry
+        self.assertEqual(login("2.2.2.2"), 200)
+        self.assertEqual(login("9.9.9.9, 2.2.2.2"), 200)
+        self.assertEqual(login("8.8.8.8, 2.2.2.2"), 429)
+
+
+class ProfileLimitTestCase(DBTestCase):
+    """Test password checks on profile edits are limited per user."""
+
+    config = LimitedConfig
+
+    def test_profile_limited(self):
+        """Is the third profile POST in a minute refused?"""
+
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.fixture_user("testuser").id
+        data = {
+            "username": "testuser",
+            "email": "test@test.com",
+            "password": "wrong-password",
+        }
+
+        self.assertEqual(client.post("/users/profile", data=data).status_code,
+                         200)
+        self.assertEqual(client.post("/users/profile", data=data).status_code,
+                         200)
+
+        resp = client.post("/users/profile", data=data)
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers["Retry-After"], "30")
@@ -0,0 +1,102 @@
+"""Background task queue tests."""
+
+# run these tests like:
+#
+#    python -m unittest test_tasks.py
+
+
+import time
+from unittest import TestCase
+
+from flask import Flask
+
+from tasks import TaskQueue
+
+
+def make_app(**config):
+    """Make a bare app with a fresh TaskQueue."""
+
+    app = Flask(__name__)
+    app.config['TASKS_BATCH_WAIT'] = 5
+    app.config.update(config)
+    return app, TaskQueue(app)
+
+
+class TaskQueueTestCase(TestCase):
+    """Test batching, retries and draining."""
+
+    def test_batches_and_drains(self):
+        app, tasks = make_app()
+        batches = []
+
+        @tasks.handler('posted')
+        def record(payloads):
+            batches.append(payloads)
+
+        with app.app_context():
+            for i in range(10):
+                tasks.enqueue('posted', i)
+            tasks.drain(timeout=5)
+
+        self.assertEqual(batches, [list(range(10))])
+
+    def test_batch_size(self):
+        app, tasks = make_app(TASKS_BATCH_SIZE=4)
+        batches = []
+        tasks.handler('posted')(batches.append)
+
+        with app.app_context():
+            for i in range(10):
+                tasks.enqueue('posted', i)
+            tasks.drain(timeout=5)
+
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 2])
+
+    def test_retries_failed_batch(self):
+        app, tasks = make_app(TASKS_MAX_ATTEMPTS=3, TASKS_RETRY_DELAY=0)
+        calls = []
+
+        @tasks.handler('posted')
+        def flaky(payloads):
+            calls.append(payloads)
+            if len(calls) < 3:
+                raise ValueError("try again")
+
+        with app.app_context():
+            tasks.enqueue('posted', 'a')
+            tasks.enqueue('posted', 'b')
+            with self.assertLogs('tasks', 'ERROR'):
+                tasks.drain(timeout=5)
+
+        self.assertEqual(calls, [['a', 'b']] * 3)
+
+    def test_retry_backs_off(self):
+        app, tasks = make_app(TASKS_BATCH_WAIT=0, TASKS_RETRY_DELAY=0.1)
+        calls = []
+
+        @tasks.handler('posted')
+        def flaky(payloads):
+            calls.append(time.monotonic())
+            if len(calls) < 3:
+                raise ValueError("try again")
+
+        with app.app_context():
+            tasks.enqueue('posted', 'a')
+            with self.assertLogs('tasks', 'ERROR'):
+                tasks.drain(timeout=5)
+
+        self.assertEqual(len(calls), 3)
+        # waits 0.1s, then 0.2s
+        self.assertGreaterEqual(calls[1] - calls[0], 0.1)
+        self.assertGreaterEqual(calls[2] - calls[1], 0.2)
+
+    def test_eager(self):
+        app, tasks = make_app(TASKS_EAGER=True)
+        batches = []
+        tasks.handler('posted')(batches.append)
+
+        with app.app_context():
+            tasks.enqueue('posted', 1)
+            tasks.enqueue('unhandled', 2)
+
+        self.assertEqual(batches, [[1]])
@@ -5,48 +5,29 @@
 #    python -m unittest test_user_model.py
 
 
-import os
-from unittest import TestCase
+from app import create_app
+from config import DevelopmentConfig, UnitTestConfig
+from models import db, User
+from testing import DBTestCase
 
-from models import db, User, Message, Follows
 
-# BEFORE we import our app, let's set an environmental variable
-# to use a different database for tests (we need to do this
-# before we import our app, since that will have already
-# connected to the database
-
-os.environ['DATABASE_URL'] = "postgresql:///warbler-test"
-
-
-# Now we can import app
-
-from app import app
-
-# Create our tables (we do this here, so we only create the tables
-# once for all tests --- in each test, we'll delete the data
-# and create fresh new clean test data
-
-db.create_all()
-
-
-class UserModelTestCase(TestCase):
+class UserModelTestCase(DBTestCase):
     """Test views for messages."""
 
-    def setUp(self):
-        """Create test client, add sample data."""
+    config = UnitTestConfig
 
-        User.query.delete()
-        Message.query.delete()
-        Follows.query.delete()
+    def setUp(self):
+        """Create test client."""
 
-        self.client = app.test_client()
+        super().setUp()
+        self.client = self.app.test_client()
 
     def test_user_model(self):
         """Does basic model work?"""
 
         u = User(
-            email="test@test.com",
-            username="testuser",
+            email="new@test.com",
+            username="newuser",
             password="HASHED_PASSWORD"
         )
 
@@ -55,4 +36,15 @@ class UserModelTestCase(TestCase):
 
         # User should have no messages & no followers
         self.assertEqual(len(u.messages), 0)
-        self.assertEqual(len(u.followers), 0)
\ No newline at end of file
+        self.assertEqual(len(u.followers), 0)
+
+    def test_signup_uses_app_bcrypt_rounds(self):
+        """Is the password hashed at this app's (cheap) bcrypt cost?"""
+
+        # building an app with other settings mustn't change ours
+        create_app(DevelopmentConfig)
+
+        u = User.signup("newuser", "new@test.com", "password", None)
+
+        self.assertTrue(u.password.startswith("$2b$04$"))
+        self.assertTrue(u.check_password("password"))
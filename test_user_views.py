@@ -0,0 +1,99 @@
+"""User View tests."""
+
+# run these tests like:
+#
+#    python -m pytest test_user_views.py
+#
+# (DBTestCase runs each test in a transaction against TEST_DATABASE_URL,
+# and rolls it back afterwards; see testing.py.)
+
+
+from app import CURR_USER_KEY
+from models import model_changed, User
+from testing import DBTestCase
+
+
+class UserViewTestCase(DBTestCase):
+    """Test views for users."""
+
+    def setUp(self):
+        """Create test client, log in as fixture user."""
+
+        super().setUp()
+        self.client = self.app.test_client()
+        self.testuser = self.fixture_user("testuser")
+
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = self.testuser.id
+
+        self.changes = []
+        model_changed.connect(self.record_change)
+        self.addCleanup(model_changed.disconnect, self.record_change)
+
+    def record_change(self, sender, **kwargs):
+        """Note a model_changed signal, for tests to check."""
+
+        self.changes.append((sender, kwargs))
+
+    def test_logout(self):
+        """Does logging out clear the session?"""
+
+        resp = self.client.get("/logout")
+
+        self.assertEqual(resp.status_code, 302)
+        with self.client.session_transaction() as sess:
+            self.assertNotIn(CURR_USER_KEY, sess)
+
+    def test_profile_form(self):
+        """Is the profile form filled in with the user's details?"""
+
+        resp = self.client.get("/users/profile")
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'value="testuser"', resp.data)
+
+    def test_profile_update(self):
+        """Are only the changed columns saved and signalled?"""
+
+        resp = self.client.post("/users/profile", data={
+            "username": "testuser",
+            "email": "test@test.com",
+            "location": "Warblerville",
+            "password": "testuser",
+        })
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(User.query.get(self.testuser.id).location,
+                         "Warblerville")
+        self.assertEqual(self.changes, [
+            (User, {"id": self.testuser.id,
+                    "changes": {"location": "Warblerville"}}),
+        ])
+
+    def test_profile_wrong_password(self):
+        """Is an edit with the wrong password refused?"""
+
+        resp = self.client.post("/users/profile", data={
+            "username": "hacked",
+            "email": "test@test.com",
+            "password": "wrong-password",
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"Wrong password", resp.data)
+        self.assertEqual(User.query.get(self.testuser.id).username,
+                         "testuser")
+        self.assertEqual(self.changes, [])
+
+    def test_profile_username_taken(self):
+        """Is changing to another user's username refused?"""
+
+        resp = self.client.post("/users/profile", data={
+            "username": "otheruser",
+            "email": "test@test.com",
+            "password": "testuser",
+        })
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b"already taken", resp.data)
+        self.assertEqual(self.changes, [])
@@ -0,0 +1,190 @@
+"""Test harness for Warbler: shared apps, seeded fixtures, per-test rollback.
+
+Subclass `DBTestCase` instead of `TestCase` for anything that touches the
+database. For each config, the app is built and its database created and
+seeded with `FIXTURE_USERS` (etc.) once per process; every test then runs
+inside a transaction (with a savepoint, so views calling commit/rollback
+still work) that is rolled back afterwards. Tests never need to delete
+data, and they see the fixtures in the same state every time.
+
+Parallel runs (``pytest -n auto``, via pytest-xdist) get a database per
+worker: ``warbler-test`` becomes ``warbler-test-gw0``, ``-gw1``, ... These
+are created on first use.
+"""
+
+import os
+from unittest import TestCase
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
+
+from app import create_app
+from config import TestingConfig
+from models import db, User, Message, Follows
+
+
+# Fixture data, seeded once per database. Passwords are hashed at the
+# TestingConfig bcrypt cost, so they are cheap to check.
+
+FIXTURE_USERS = [
+    dict(username="testuser", email="test@test.com", password="testuser"),
+    dict(username="otheruser", email="other@test.com", password="otheruser"),
+]
+
+FIXTURE_MESSAGES = [
+    dict(username="otheruser", text="Hello from otheruser"),
+]
+
+# (follower, followed)
+FIXTURE_FOLLOWS = [
+    ("testuser", "otheruser"),
+]
+
+_apps = {}
+
+
+def worker_database_url(url):
+    """Return `url` adjusted to be private to this pytest-xdist worker."""
+
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    url = make_url(url)
+
+    if not worker or url.drivername.startswith('sqlite'):
+        return str(url)
+
+    url.database = f"{url.database}-{worker}"
+    return str(url)
+
+
+def ensure_database(url):
+    """Create postgres database named in `url` if it doesn't exist yet."""
+
+    url = make_url(url)
+    if not url.drivername.startswith('postgresql'):
+        return
+
+    name = url.database
+    url.database = 'postgres'
+    engine = create_engine(url, isolation_level='AUTOCOMMIT')
+
+    try:
+        with engine.connect() as conn:
+            exists = conn.execute(
+                "SELECT 1 FROM pg_database WHERE datname = %s", name).scalar()
+            if not exists:
+                conn.execute(f'CREATE DATABASE "{name}"')
+    finally:
+        engine.dispose()
+
+
+def _enable_sqlite_savepoints(engine):
+    """Make pysqlite leave transaction control (and SAVEPOINT) to us.
+
+    See "Serializable isolation / Savepoints / Transactional DDL" in the
+    SQLAlchemy SQLite dialect docs.
+    """
+
+    @event.listens_for(engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, "begin")
+    def do_begin(conn):
+        conn.execute("BEGIN")
+
+
+def seed_fixtures():
+    """Add fixture users, messages and follows, and commit them."""
+
+    users = {}
+    for data in FIXTURE_USERS:
+        users[data['username']] = User.signup(image_url=None, **data)
+    db.session.flush()
+
+    for data in FIXTURE_MESSAGES:
+        db.session.add(Message(text=data['text'],
+                               user_id=users[data['username']].id))
+
+    for follower, followed in FIXTURE_FOLLOWS:
+        db.session.add(Follows(user_following_id=users[follower].id,
+                               user_being_followed_id=users[followed].id))
+
+    db.session.commit()
+
+
+def get_test_app(config=TestingConfig):
+    """Return the shared, seeded app for `config`, building it if needed."""
+
+    if config in _apps:
+        return _apps[config]
+
+    url = worker_database_url(config.SQLALCHEMY_DATABASE_URI)
+    ensure_database(url)
+
+    app = create_app(
+        type(config.__name__, (config,), {'SQLALCHEMY_DATABASE_URI': url}))
+
+    with app.app_context():
+        if db.engine.url.drivername.startswith('sqlite'):
+            _enable_sqlite_savepoints(db.engine)
+        db.drop_all()
+        db.create_all()
+        seed_fixtures()
+
+    _apps[config] = app
+    return app
+
+
+class DBTestCase(TestCase):
+    """Base class for tests using the database.
+
+    Each test runs in an app context, with `db.session` bound to a
+    connection whose transaction is rolled back in tearDown.
+
+    Set `config` on the subclass to use a different config (eg
+    UnitTestConfig for in-memory SQLite).
+    """
+
+    config = TestingConfig
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.app = get_test_app(cls.config)
+
+    def setUp(self):
+        """Start a transaction and bind db.session to it."""
+
+        self._app_context = self.app.app_context()
+        self._app_context.push()
+
+        self._connection = db.engine.connect()
+        self._transaction = self._connection.begin()
+
+        self._session = db.session
+        db.session = db.create_scoped_session(
+            options=dict(bind=self._connection, binds={}))
+        db.session.begin_nested()
+
+        @event.listens_for(db.session, "after_transaction_end")
+        def restart_savepoint(session, transaction):
+            """When the app ends our savepoint, start a new one."""
+
+            if transaction.nested and not transaction._parent.nested:
+                session.expire_all()
+                session.begin_nested()
+
+    def tearDown(self):
+        """Roll back everything the test did."""
+
+        db.session.remove()
+        db.session = self._session
+
+        self._transaction.rollback()
+        self._connection.close()
+        self._app_context.pop()
+
+    def fixture_user(self, username):
+        """Get fixture user by `username`."""
+
+        return User.query.filter_by(username=username).one()